@@ -1,6 +1,6 @@
 # backend/app.py
 from flask import Flask, jsonify, request
-from flask import has_request_context
+from flask import has_request_context, g, Response
 from flask_cors import CORS
 import pandas as pd
 import random
@@ -15,7 +15,12 @@ import pickle
 import threading
 import time
 from generate_dataset import generate_new_dataset
-from csv_to_sqlite import rebuild_db_from_csv
+from csv_to_sqlite import rebuild_db_from_csv, csv_file
+import shared_frame
+import db
+import batch_scoring
+import metrics
+import profiling
 
 # Global model holder (demo only; in production consider a class / persistence layer)
 MODEL: Optional[LogisticRegression] = None
@@ -26,19 +31,40 @@ MODEL_LOCK = threading.Lock()
 SCALER: Optional[StandardScaler] = None
 SCHEDULER_THREAD: Optional[threading.Thread] = None
 SCHEDULER_STOP = threading.Event()
+SCORING_THREAD: Optional[threading.Thread] = None
+
+MODELS_DIR = os.getenv('MODELS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models'))
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+profiling.init_app(app)  # no-op unless PROFILING_TOKEN is set
 
 def load_or_generate_df() -> pd.DataFrame:
-    """Load student data from SQLite DB if present, else fallback to synthetic dataset."""
-    import sqlite3
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    db_path = os.path.join(base_dir, 'student_data.db')
-    if os.path.exists(db_path):
-        conn = sqlite3.connect(db_path)
-        df = pd.read_sql_query("SELECT * FROM students", conn)
-        conn.close()
+    """Load student data from SQLite DB if present, else fallback to synthetic dataset.
+
+    Under the pre-forked launcher (wsgi.py) the frame is read from shared memory instead,
+    and republished first if the DB was rebuilt since (by any worker or process).
+    """
+    if shared_frame.is_enabled():
+        sync_shared_frame()
+        return shared_frame.current_frame()
+    return _read_students_df()
+
+
+def sync_shared_frame() -> bool:
+    """Republish the shared student frame if the DB roster generation moved on."""
+    generation = db.roster_generation()
+    if generation <= shared_frame.get_roster_generation():
+        return False
+    return shared_frame.refresh(generation, _read_students_df)
+
+
+def _read_students_df() -> pd.DataFrame:
+    if os.path.exists(db.DB_FILE):
+        # Per-thread pooled WAL connection; see db.py
+        with metrics.span('sqlite_read'):
+            df = pd.read_sql_query(db.SELECT_STUDENTS, db.get_connection())
+        metrics.ROWS_PROCESSED.inc(len(df), stage='sqlite_read')
         return df
     # Fallback synthetic data
     rows: List[dict] = []
@@ -72,6 +98,13 @@ def enrich_with_risk(df: pd.DataFrame,
     When called outside request context (e.g., scheduler), safe defaults are used
     unless explicit values are provided via arguments.
     """
+    with metrics.span('enrich_with_risk'):
+        out = _enrich_with_risk(df, att_hi, score_hi, att_med, score_med)
+    metrics.ROWS_PROCESSED.inc(len(out), stage='enrich_with_risk')
+    return out
+
+
+def _enrich_with_risk(df, att_hi, score_hi, att_med, score_med) -> pd.DataFrame:
     # Threshold overrides via query params (when available)
     if has_request_context():
         att_hi = float(request.args.get('att_high', att_hi if att_hi is not None else 70))
@@ -158,31 +191,41 @@ def prepare_ml_dataset(df: pd.DataFrame):
 
 
 def _persist_model(model: LogisticRegression):
-    models_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+    with metrics.span('persist_model'):
+        return _write_model_files(model)
+
+
+def _write_model_files(model: LogisticRegression):
+    models_dir = MODELS_DIR
     os.makedirs(models_dir, exist_ok=True)
     filename = f'model_v{MODEL_VERSION}.pkl'
     path = os.path.join(models_dir, filename)
-    with open(path, 'wb') as f:
-        pickle.dump({
-            'version': MODEL_VERSION,
-            'model': model,
-            'features': MODEL_FEATURES,
-            'classes': MODEL_CLASSES,
-            'scaler': SCALER
-        }, f)
+    payload = {
+        'version': MODEL_VERSION,
+        'model': model,
+        'features': MODEL_FEATURES,
+        'classes': MODEL_CLASSES,
+        'scaler': SCALER
+    }
+    _atomic_pickle(path, payload)
     # also write latest.pkl
     latest = os.path.join(models_dir, 'latest.pkl')
-    with open(latest, 'wb') as f:
-        pickle.dump({
-            'version': MODEL_VERSION,
-            'model': model,
-            'features': MODEL_FEATURES,
-            'classes': MODEL_CLASSES,
-            'scaler': SCALER
-        }, f)
+    if shared_frame.is_enabled():
+        # Only the newest model across workers becomes latest.pkl; siblings reload it
+        shared_frame.publish_model(MODEL_VERSION, lambda: _atomic_pickle(latest, payload))
+    else:
+        _atomic_pickle(latest, payload)
     return path
 
 
+def _atomic_pickle(path: str, payload: dict):
+    """Write via a temp file + os.replace so readers never see a partial pickle."""
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(payload, f)
+    os.replace(tmp, path)
+
+
 def _load_latest_model_if_any() -> bool:
     """Attempt to load the latest persisted model from disk into globals.
 
@@ -190,8 +233,7 @@ def _load_latest_model_if_any() -> bool:
     """
     global MODEL, MODEL_FEATURES, MODEL_VERSION, MODEL_CLASSES, SCALER
     try:
-        models_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
-        latest = os.path.join(models_dir, 'latest.pkl')
+        latest = os.path.join(MODELS_DIR, 'latest.pkl')
         if not os.path.exists(latest):
             return False
         with open(latest, 'rb') as f:
@@ -212,6 +254,14 @@ def _load_latest_model_if_any() -> bool:
 
 
 def _train_internal() -> dict:
+    t0 = time.perf_counter()
+    try:
+        return _train()
+    finally:
+        metrics.TRAINING_SECONDS.observe(time.perf_counter() - t0)
+
+
+def _train() -> dict:
     global MODEL, MODEL_FEATURES, MODEL_VERSION, MODEL_CLASSES, SCALER
     base_df = enrich_with_risk(load_or_generate_df())
     X, y = prepare_ml_dataset(base_df)
@@ -222,12 +272,12 @@ def _train_internal() -> dict:
     X_test_scaled = scaler.transform(X_test)
 
     model = LogisticRegression(max_iter=500, multi_class='auto')
-    model.fit(X_train_scaled, y_train)
+    with metrics.span('model_fit'):
+        model.fit(X_train_scaled, y_train)
     y_pred = model.predict(X_test_scaled)
     acc = float(accuracy_score(y_test, y_pred))
     # Per-class metrics
     classes = sorted(y.unique())
-    MODEL_CLASSES = classes
     metrics_per_class = {}
     for cls in classes:
         # binary view per class
@@ -256,27 +306,39 @@ def _train_internal() -> dict:
     except Exception:
         macro_roc_auc = None
 
+    t_lock = time.perf_counter()
     with MODEL_LOCK:
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - t_lock, stage='model_lock_wait')
         MODEL = model
         MODEL_FEATURES = list(X.columns)
-        MODEL_VERSION += 1
+        MODEL_CLASSES = classes
+        if shared_frame.is_enabled():
+            # Versions are allocated across workers so concurrent trains never collide
+            MODEL_VERSION = shared_frame.allocate_model_version(MODEL_VERSION)
+        else:
+            MODEL_VERSION += 1
         SCALER = scaler
         _persist_model(model)
+        # Report what this call trained, even if a sibling swaps the globals afterwards
+        version, features = MODEL_VERSION, MODEL_FEATURES
+
+    # Materialize predictions for the whole roster with the new model
+    _trigger_batch_scoring()
 
     # Feature importance (coefficients). For multiclass, report per class.
     coefs = {}
     try:
         for cls_idx, cls in enumerate(model.classes_):
-            coefs[str(cls)] = {feat: float(model.coef_[cls_idx][i]) for i, feat in enumerate(MODEL_FEATURES)}
+            coefs[str(cls)] = {feat: float(model.coef_[cls_idx][i]) for i, feat in enumerate(features)}
     except Exception:
         coefs = {}
 
     # Confusion matrix in class order
-    cm = confusion_matrix(y_test, y_pred, labels=MODEL_CLASSES).tolist()
+    cm = confusion_matrix(y_test, y_pred, labels=classes).tolist()
 
     return {
         'status': 'trained',
-        'version': MODEL_VERSION,
+        'version': version,
         'overall': {
             'accuracy': acc,
             'macro_precision': macro_precision,
@@ -285,14 +347,47 @@ def _train_internal() -> dict:
             'macro_roc_auc': macro_roc_auc,
         },
         'per_class': metrics_per_class,
-        'features': MODEL_FEATURES,
-        'classes': MODEL_CLASSES,
+        'features': features,
+        'classes': classes,
         'coefficients': coefs,
         'confusion_matrix': cm,
         'samples': len(X)
     }
 
 
+def _model_superseded(version: int) -> bool:
+    # A sibling worker published a newer model; its own scoring run covers the roster
+    return shared_frame.is_enabled() and version < shared_frame.get_model_version()
+
+
+def _run_batch_scoring():
+    with MODEL_LOCK:
+        model, scaler, features, version = MODEL, SCALER, list(MODEL_FEATURES), MODEL_VERSION
+    if model is None or not os.path.exists(db.DB_FILE):
+        return
+    if _model_superseded(version):
+        print(f'Batch scoring v{version}: skipped, superseded by v{shared_frame.get_model_version()}')
+        return
+    try:
+        with metrics.span('batch_scoring'):
+            count = batch_scoring.score_students(model, scaler, features, version,
+                                                 stale=lambda: _model_superseded(version))
+        metrics.ROWS_PROCESSED.inc(count, stage='batch_scoring')
+        print(f'Batch scoring v{version}: {count} students')
+    except Exception as e:
+        print('Batch scoring failed:', e)
+    finally:
+        db.close_connection()
+
+
+def _trigger_batch_scoring() -> threading.Thread:
+    """Score the roster in the background; the newest run of the newest model wins."""
+    global SCORING_THREAD
+    SCORING_THREAD = threading.Thread(target=_run_batch_scoring, name='batch-scoring', daemon=True)
+    SCORING_THREAD.start()
+    return SCORING_THREAD
+
+
 @app.route('/api/train', methods=['POST'])
 def train_model():
     result = _train_internal()
@@ -321,11 +416,15 @@ def predict():
         if col not in X.columns:
             X[col] = 0
     X = X[MODEL_FEATURES]
+    t_lock = time.perf_counter()
     with MODEL_LOCK:
-        X_scaled = SCALER.transform(X) if SCALER is not None else X
-        probs = MODEL.predict_proba(X_scaled)
-        pred_labels = MODEL.predict(X_scaled)
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - t_lock, stage='model_lock_wait')
+        with metrics.span('predict_proba'):
+            X_scaled = SCALER.transform(X) if SCALER is not None else X
+            probs = MODEL.predict_proba(X_scaled)
+            pred_labels = MODEL.predict(X_scaled)
         class_list = list(MODEL_CLASSES)
+    metrics.ROWS_PROCESSED.inc(len(X), stage='predict')
     results = []
     for original, label, prob_vec in zip(items, pred_labels, probs):
         probs_map = {cls: float(prob_vec[i]) for i, cls in enumerate(class_list)}
@@ -342,6 +441,28 @@ def predict():
     })
 
 
+@app.before_request
+def _start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def _observe_request(response):
+    start = g.get('request_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, route=route,
+                                        method=request.method, status=response.status_code)
+    return response
+
+
+@app.before_request
+def _sync_shared_model():
+    """In pre-forked workers, pick up a model trained by a sibling process."""
+    if shared_frame.is_enabled() and shared_frame.get_model_version() > MODEL_VERSION:
+        _load_latest_model_if_any()
+
+
 # Utility consistent with Node thresholds
 def _derive_risk_tier_for(score: Optional[float]) -> str:
     if score is None:
@@ -494,28 +615,68 @@ def _scheduler_loop(interval_seconds: int):
     while not SCHEDULER_STOP.is_set():
         try:
             _train_internal()
+            metrics.SCHEDULER_RUNS.inc(result='ok')
         except Exception as e:
+            metrics.SCHEDULER_RUNS.inc(result='error')
             print('Scheduled retrain failed:', e)
         SCHEDULER_STOP.wait(interval_seconds)
 
 
+def _start_scheduler_thread(interval: int):
+    global SCHEDULER_THREAD
+    SCHEDULER_STOP.clear()
+    SCHEDULER_THREAD = threading.Thread(target=_scheduler_loop, args=(interval,), name='retrain-scheduler', daemon=True)
+    SCHEDULER_THREAD.start()
+
+
+def _scheduler_owner_loop(poll_seconds: float):
+    """Follow the scheduler state in the control segment (pre-forked launcher only)."""
+    running = 0
+    while True:
+        interval = shared_frame.get_scheduler_interval()
+        if interval != running:
+            if SCHEDULER_THREAD and SCHEDULER_THREAD.is_alive():
+                SCHEDULER_STOP.set()
+                SCHEDULER_THREAD.join()
+            if interval:
+                _start_scheduler_thread(interval)
+            running = interval
+        time.sleep(poll_seconds)
+
+
+def start_scheduler_owner(poll_seconds: float = 1.0):
+    """Make this worker the one that runs scheduled retrains.
+
+    Under wsgi.py's pre-forked launcher /api/schedule_retrain and /api/stop_retrain
+    may land on any worker, so they only flip the interval in the control segment;
+    the designated worker calls this to start and stop the actual thread.
+    """
+    threading.Thread(target=_scheduler_owner_loop, args=(poll_seconds,),
+                     name='retrain-scheduler-owner', daemon=True).start()
+
+
 @app.route('/api/schedule_retrain', methods=['POST'])
 def schedule_retrain():
-    global SCHEDULER_THREAD
     payload = request.get_json(silent=True) or {}
     interval = int(payload.get('interval_seconds', 3600))
     if interval < 60:
         return jsonify({'error': 'Minimum interval 60 seconds'}), 400
+    if shared_frame.is_enabled():
+        if not shared_frame.start_scheduler(interval):
+            return jsonify({'status': 'already-running'}), 200
+        return jsonify({'status': 'scheduled', 'interval_seconds': interval})
     if SCHEDULER_THREAD and SCHEDULER_THREAD.is_alive():
         return jsonify({'status': 'already-running'}), 200
-    SCHEDULER_STOP.clear()
-    SCHEDULER_THREAD = threading.Thread(target=_scheduler_loop, args=(interval,), daemon=True)
-    SCHEDULER_THREAD.start()
+    _start_scheduler_thread(interval)
     return jsonify({'status': 'scheduled', 'interval_seconds': interval})
 
 
 @app.route('/api/stop_retrain', methods=['POST'])
 def stop_retrain():
+    if shared_frame.is_enabled():
+        if not shared_frame.stop_scheduler():
+            return jsonify({'status': 'not-running'})
+        return jsonify({'status': 'stopping'})
     if not SCHEDULER_THREAD or not SCHEDULER_THREAD.is_alive():
         return jsonify({'status': 'not-running'})
     SCHEDULER_STOP.set()
@@ -534,6 +695,18 @@ def health():
     })
 
 
+metrics.Gauge('pathkeeper_model_version', 'Version of the model loaded in this process.',
+              fn=lambda: MODEL_VERSION)
+metrics.Gauge('pathkeeper_model_loaded', '1 if a model is loaded in this process.',
+              fn=lambda: int(MODEL is not None))
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition; merged across workers under the pre-forked launcher."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/api/students', methods=['GET'])
 def get_students():
     df = load_or_generate_df()
@@ -541,6 +714,12 @@ def get_students():
     # Enrich with risk first (so we can filter by risk)
     df = enrich_with_risk(df)
 
+    # Join materialized model predictions (see batch_scoring.py), if any
+    with metrics.span('predictions_join'):
+        preds = batch_scoring.load_predictions() if os.path.exists(db.DB_FILE) else None
+        if preds is not None and len(preds):
+            df = df.merge(preds, on='student_id', how='left')
+
     # Filtering params
     search = request.args.get('search', '').strip().lower()
     risk_filter = request.args.get('risk')  # e.g. High Risk|Medium Risk|Low Risk or comma separated
@@ -548,26 +727,27 @@ def get_students():
     assign_min = request.args.get('assignment_min')
     fees_paid = request.args.get('fees_paid')  # '1' for paid only
 
-    if search:
-        df = df[df['name'].str.lower().str.contains(search)]
-    if risk_filter:
-        parts = {p.strip() for p in risk_filter.replace(',', '|').split('|') if p.strip()}
-        df = df[df['risk_level'].isin(parts)]
-    if attendance_min:
-        try:
-            val = float(attendance_min)
-            df = df[df['attendance_percentage'] >= val]
-        except ValueError:
-            pass
-    if assign_min:
-        try:
-            val = float(assign_min)
-            frac = df['assignments_submitted'] / df['total_assignments'].replace({0: 1})
-            df = df[frac >= val]
-        except ValueError:
-            pass
-    if fees_paid == '1':
-        df = df[df['fees_paid'] == 1]
+    with metrics.span('filter'):
+        if search:
+            df = df[df['name'].str.lower().str.contains(search)]
+        if risk_filter:
+            parts = {p.strip() for p in risk_filter.replace(',', '|').split('|') if p.strip()}
+            df = df[df['risk_level'].isin(parts)]
+        if attendance_min:
+            try:
+                val = float(attendance_min)
+                df = df[df['attendance_percentage'] >= val]
+            except ValueError:
+                pass
+        if assign_min:
+            try:
+                val = float(assign_min)
+                frac = df['assignments_submitted'] / df['total_assignments'].replace({0: 1})
+                df = df[frac >= val]
+            except ValueError:
+                pass
+        if fees_paid == '1':
+            df = df[df['fees_paid'] == 1]
 
     # Sorting
     sort_by = request.args.get('sort_by', 'student_id')
@@ -575,10 +755,11 @@ def get_students():
     if sort_by not in df.columns:
         sort_by = 'student_id'
     ascending = sort_dir != 'desc'
-    try:
-        df = df.sort_values(by=sort_by, ascending=ascending)
-    except Exception:
-        pass
+    with metrics.span('sort'):
+        try:
+            df = df.sort_values(by=sort_by, ascending=ascending)
+        except Exception:
+            pass
 
     total = len(df)
 
@@ -594,13 +775,18 @@ def get_students():
     end = start + page_size
     page_df = df.iloc[start:end]
 
-    data = page_df.to_dict(orient='records')
-    return jsonify({
-        'data': data,
-        'total': total,
-        'page': page,
-        'page_size': page_size
-    })
+    with metrics.span('serialize'):
+        if 'predicted_risk' in page_df.columns:
+            # Students not scored yet: NaN -> null in JSON
+            page_df = page_df.astype(object).where(page_df.notna(), None)
+        data = page_df.to_dict(orient='records')
+        response = jsonify({
+            'data': data,
+            'total': total,
+            'page': page,
+            'page_size': page_size
+        })
+    return response
 
 
 @app.route('/api/notify', methods=['POST'])
@@ -635,11 +821,13 @@ def regenerate_dataset():
             seed = int(seed)
         except Exception:
             seed = None
-    path = generate_new_dataset(num_students=num_students, seed=seed)
+    path = generate_new_dataset(num_students=num_students, seed=seed, out_path=csv_file)
     # Sync CSV -> SQLite so subsequent reads reflect the new dataset
     try:
         rebuild_db_from_csv()
         csv_loaded = True
+        if shared_frame.is_enabled():
+            sync_shared_frame()
     except Exception as e:
         print('CSV to SQLite import failed:', e)
         csv_loaded = False
@@ -0,0 +1,205 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import db
+import metrics
+
+# Whole-cohort batch scoring: materialize model predictions for every student
+# so /api/students can join them instead of calling the model per request.
+
+CHUNK_SIZE = 5000
+# Same weights as the synthesized avgRisk in /api/students/risk-trend
+RISK_WEIGHTS = {'High Risk': 0.8, 'Medium Risk': 0.5, 'Low Risk': 0.2}
+
+# Freshness is keyed on run_id, the start time (ns) of the scoring run, not the
+# model version: versions can go down (a missing latest.pkl or a different
+# MODELS_DIR restarts them at 1) and a newer run must still win.
+CREATE_PREDICTIONS = '''
+    CREATE TABLE IF NOT EXISTS predictions (
+        student_id INTEGER PRIMARY KEY,
+        run_id INTEGER,
+        model_version INTEGER,
+        predicted_risk TEXT,
+        risk_score REAL,
+        probabilities TEXT
+    )
+'''
+CREATE_META = '''
+    CREATE TABLE IF NOT EXISTS prediction_runs (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        model_version INTEGER,
+        run_id INTEGER,
+        rows INTEGER,
+        completed_at REAL
+    )
+'''
+# Runs started before the last roster replace must not write into the new one
+CREATE_FLOOR = '''
+    CREATE TABLE IF NOT EXISTS prediction_floor (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        run_id INTEGER
+    )
+'''
+SELECT_CHUNK = '''
+    SELECT student_id, attendance_percentage, avg_test_score, assignments_submitted, total_assignments, fees_paid
+    FROM students WHERE student_id > ? ORDER BY student_id LIMIT ?
+'''
+# An older run finishing late must not overwrite a newer run's rows
+UPSERT_PREDICTION = '''
+    INSERT INTO predictions (student_id, run_id, model_version, predicted_risk, risk_score, probabilities)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(student_id) DO UPDATE SET
+        run_id = excluded.run_id,
+        model_version = excluded.model_version,
+        predicted_risk = excluded.predicted_risk,
+        risk_score = excluded.risk_score,
+        probabilities = excluded.probabilities
+    WHERE excluded.run_id >= predictions.run_id
+'''
+UPSERT_RUN = '''
+    INSERT INTO prediction_runs (id, run_id, model_version, rows, completed_at)
+    VALUES (1, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        run_id = excluded.run_id,
+        model_version = excluded.model_version,
+        rows = excluded.rows,
+        completed_at = excluded.completed_at
+    WHERE excluded.run_id >= prediction_runs.run_id
+'''
+SELECT_FLOOR = 'SELECT run_id FROM prediction_floor WHERE id = 1'
+SELECT_RUN = 'SELECT run_id, model_version, completed_at FROM prediction_runs WHERE id = 1'
+SELECT_PREDICTIONS = 'SELECT student_id, model_version, predicted_risk, risk_score, probabilities FROM predictions'
+
+# Per-process cache of the predictions frame, keyed by the prediction_runs row
+_CACHE = {'run': None, 'frame': None}
+_CACHE_LOCK = threading.Lock()
+
+
+def build_features(df: pd.DataFrame, features: List[str]) -> pd.DataFrame:
+    """Model input frame for raw student rows (mirrors prepare_ml_dataset)."""
+    completion_ratio = (df['assignments_submitted'] / df['total_assignments'].replace({0: 1})).fillna(0)
+    X = pd.DataFrame({
+        'attendance_percentage': df['attendance_percentage'],
+        'avg_test_score': df['avg_test_score'],
+        'completion_ratio': completion_ratio,
+        'fees_paid': df['fees_paid']
+    })
+    for col in features:
+        if col not in X.columns:
+            X[col] = 0
+    return X[features]
+
+
+def _ensure_tables(conn):
+    cols = [row[1] for row in conn.execute('PRAGMA table_info(predictions)')]
+    if cols and 'run_id' not in cols:
+        # Written by an older version keyed on model_version; rescoring refills it
+        conn.execute('DROP TABLE predictions')
+        conn.execute('DROP TABLE IF EXISTS prediction_runs')
+    conn.execute(CREATE_PREDICTIONS)
+    conn.execute(CREATE_META)
+    conn.execute(CREATE_FLOOR)
+
+
+def clear_predictions(conn):
+    """Delete all materialized predictions on ``conn``.
+
+    Call inside the transaction that replaces the students table: student ids
+    are reused across rosters, so old rows would otherwise join onto new
+    students. Runs already in flight are fenced off and stop at their next chunk.
+    """
+    _ensure_tables(conn)
+    conn.execute('DELETE FROM predictions')
+    conn.execute('DELETE FROM prediction_runs')
+    conn.execute('INSERT INTO prediction_floor (id, run_id) VALUES (1, ?) '
+                 'ON CONFLICT(id) DO UPDATE SET run_id = excluded.run_id', (time.time_ns(),))
+
+
+def _superseded(conn, run_id: int) -> bool:
+    row = conn.execute(SELECT_FLOOR).fetchone()
+    return row is not None and row[0] > run_id
+
+
+def score_students(model, scaler, features: List[str], version: int,
+                   db_path: str = db.DB_FILE, chunk_size: int = CHUNK_SIZE,
+                   stale: Optional[Callable[[], bool]] = None) -> int:
+    """Score every row of ``students`` with ``model`` and upsert into ``predictions``.
+
+    Reads and writes in chunks of ``chunk_size`` (one transaction per chunk).
+    Returns the number of rows scored; stops early if the roster is replaced
+    while the run is in progress, or once ``stale()`` reports that ``model``
+    has been superseded (e.g. by a newer model from another worker).
+    """
+    run_id = time.time_ns()
+    conn = db.get_connection(db_path)
+    with db.transaction(db_path) as tx:
+        _ensure_tables(tx)
+    classes = [str(c) for c in model.classes_]
+    weights = np.array([RISK_WEIGHTS.get(c, 0.0) for c in classes])
+    last_id = -1
+    total = 0
+    while True:
+        chunk = pd.read_sql_query(SELECT_CHUNK, conn, params=(last_id, chunk_size))
+        if chunk.empty:
+            break
+        X = build_features(chunk, features)
+        X_scaled = scaler.transform(X) if scaler is not None else X
+        probs = model.predict_proba(X_scaled)
+        labels = np.asarray(model.classes_)[probs.argmax(axis=1)]
+        scores = probs @ weights
+        rows = [
+            (int(sid), run_id, int(version), str(label), float(score),
+             json.dumps({cls: float(p) for cls, p in zip(classes, prob_vec)}))
+            for sid, label, score, prob_vec in zip(chunk['student_id'], labels, scores, probs)
+        ]
+        with db.transaction(db_path) as tx:
+            if _superseded(tx, run_id) or (stale is not None and stale()):
+                return total
+            tx.executemany(UPSERT_PREDICTION, rows)
+        total += len(rows)
+        last_id = int(chunk['student_id'].iloc[-1])
+    with db.transaction(db_path) as tx:
+        if _superseded(tx, run_id) or (stale is not None and stale()):
+            return total
+        # Drop predictions for students no longer on the roster
+        tx.execute('DELETE FROM predictions WHERE run_id < ? '
+                   'AND student_id NOT IN (SELECT student_id FROM students)', (run_id,))
+        tx.execute(UPSERT_RUN, (run_id, int(version), total, time.time()))
+    return total
+
+
+def load_predictions(db_path: str = db.DB_FILE) -> Optional[pd.DataFrame]:
+    """Return materialized predictions as a frame, or None if no run has completed.
+
+    The frame is cached until another scoring run (in any process) completes, so
+    the per-request cost is a single-row lookup.
+    """
+    conn = db.get_connection(db_path)
+    try:
+        row = conn.execute(SELECT_RUN).fetchone()
+    except sqlite3.OperationalError:
+        # Tables not created yet
+        return None
+    if row is None:
+        return None
+    run = tuple(row)
+    with _CACHE_LOCK:
+        if _CACHE['run'] == run:
+            metrics.CACHE_REQUESTS.inc(cache='predictions', result='hit')
+            return _CACHE['frame']
+        metrics.CACHE_REQUESTS.inc(cache='predictions', result='miss')
+        frame = pd.read_sql_query(SELECT_PREDICTIONS, conn)
+        frame['probabilities'] = [json.loads(p) for p in frame['probabilities']]
+        frame = frame.rename(columns={
+            'model_version': 'predicted_model_version',
+            'risk_score': 'predicted_risk_score',
+            'probabilities': 'predicted_probabilities',
+        })
+        _CACHE.update(run=run, frame=frame)
+        return frame
@@ -0,0 +1,270 @@
+"""Benchmarks for the Flask backend hot paths.
+
+Each cohort size runs in its own subprocess against a scratch CSV, SQLite DB
+and models dir (STUDENT_CSV / STUDENT_DB / MODELS_DIR), so the checked-in
+data is never touched and peak RSS is measured per cohort. Routes are driven
+through the Flask test client; internal stages are called directly.
+
+    python bench.py --save bench_baseline.json             # record a baseline
+    python bench.py --baseline bench_baseline.json         # compare, exit 1 on regression
+    python bench.py --sizes 1000,100000 --tolerance 0.3
+
+A case regresses when its fastest run exceeds the baseline's fastest run by
+more than ``--tolerance`` (fractional) and by at least ``--min-delta-ms``. The
+minimum is used because timing noise only ever adds time. Cases with fewer
+than ``--min-runs`` runs in either result, which includes every case in the
+1M cohort that goes through the row-wise enrich_with_risk (run once), are
+still gated but against the wider ``--low-runs-tolerance``; the cheaper
+cases run at least three times at every size. Peak RSS is checked against
+``--tolerance``. Baselines are machine-specific: record one on the machine you
+compare on. Use --sizes to skip the slow 1M cohort for quick checks.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from metrics import percentile
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = (1000, 100000, 1000000)
+MIN_RUNS = 5
+LOW_RUNS_TOLERANCE = 0.5
+# Cases that skip the row-wise enrichment are cheap enough to repeat even at 1M
+CHEAP_RUNS = 3
+
+
+def _default_repeats(size: int) -> int:
+    # enrich_with_risk is row-wise; keep the 1M cohort to a single pass per case
+    if size <= 1000:
+        return 20
+    if size <= 100000:
+        return MIN_RUNS
+    return 1
+
+
+def _summarize(samples, rows):
+    total = sum(samples)
+    return {
+        'runs': len(samples),
+        'min_ms': min(samples) * 1000.0,
+        'p50_ms': percentile(samples, 50) * 1000.0,
+        'p99_ms': percentile(samples, 99) * 1000.0,
+        'mean_ms': total / len(samples) * 1000.0,
+        'ops_per_s': len(samples) / total if total else None,
+        'rows_per_s': rows * len(samples) / total if total else None,
+    }
+
+
+def _peak_rss_mb() -> float:
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+def run_cohort(size: int, repeats: int) -> dict:
+    """Run every case for one cohort size in this process (env already isolated)."""
+    import app
+    from csv_to_sqlite import rebuild_db_from_csv, csv_file
+    from generate_dataset import generate_new_dataset
+
+    client = app.app.test_client()
+    cases = {}
+
+    def timed(name, fn, rows, runs=repeats, after=None):
+        samples = []
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - t0)
+            if after is not None:
+                after()
+        cases[name] = _summarize(samples, rows)
+
+    cheap_runs = max(min(repeats, MIN_RUNS), CHEAP_RUNS)
+
+    def join_scoring():
+        if app.SCORING_THREAD is not None:
+            app.SCORING_THREAD.join()
+
+    def get_ok(url):
+        def call():
+            resp = client.get(url)
+            assert resp.status_code == 200, (url, resp.status_code)
+        return call
+
+    def post_ok(url, payload=None):
+        def call():
+            resp = client.post(url, json=payload)
+            assert resp.status_code == 200, (url, resp.status_code)
+        return call
+
+    generate_new_dataset(num_students=size, seed=42, out_path=csv_file)
+    with contextlib.redirect_stdout(io.StringIO()):
+        timed('rebuild_db_from_csv', rebuild_db_from_csv, size, runs=cheap_runs)
+
+    timed('load_or_generate_df', app.load_or_generate_df, size, runs=max(repeats, CHEAP_RUNS))
+    base_df = app.load_or_generate_df()
+    timed('enrich_with_risk', lambda: app.enrich_with_risk(base_df), size)
+
+    last_page = max(1, size // 25)
+    students_cases = {
+        'get_students': '/api/students',
+        'get_students_search': '/api/students?search=sharma',
+        'get_students_filters': '/api/students?risk=High%20Risk,Medium%20Risk&attendance_min=60&fees_paid=1',
+        'get_students_sort_desc': '/api/students?sort_by=avg_test_score&sort_dir=desc',
+        'get_students_deep_page': f'/api/students?page={last_page}&page_size=25',
+        'get_students_page_size_200': f'/api/students?page={max(1, size // 400)}&page_size=200',
+    }
+    for name, url in students_cases.items():
+        timed(name, get_ok(url), size)
+    timed('students_risk_trend', get_ok('/api/students/risk-trend?days=30'), size)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Each train starts background scoring; wait for it outside the timed
+        # region so it never overlaps the next run, then time scoring on its own
+        timed('train', post_ok('/api/train'), size, runs=min(repeats, MIN_RUNS), after=join_scoring)
+        timed('batch_scoring', app._run_batch_scoring, size, runs=cheap_runs)
+
+    student = {'attendance_percentage': 72, 'avg_test_score': 68, 'assignments_submitted': 6,
+               'total_assignments': 10, 'fees_paid': 1}
+    timed('predict_1', post_ok('/api/predict', {'students': [student]}), 1, runs=max(repeats, 20))
+    timed('predict_10k', post_ok('/api/predict', {'students': [student] * 10000}), 10000,
+          runs=max(repeats, CHEAP_RUNS))
+    timed('get_students_with_predictions', get_ok('/api/students?sort_by=predicted_risk_score&sort_dir=desc'), size)
+
+    return {'students': size, 'repeats': repeats, 'cases': cases, 'peak_rss_mb': _peak_rss_mb()}
+
+
+def _run_in_subprocess(size: int, repeats: int) -> dict:
+    with tempfile.TemporaryDirectory(prefix='pathkeeper-bench-') as tmp:
+        env = dict(os.environ)
+        env.update({
+            'STUDENT_CSV': os.path.join(tmp, 'student_data.csv'),
+            'STUDENT_DB': os.path.join(tmp, 'student_data.db'),
+            'MODELS_DIR': os.path.join(tmp, 'models'),
+            'PYTHONWARNINGS': 'ignore',
+        })
+        env.pop('PROFILING_TOKEN', None)
+        out = os.path.join(tmp, 'result.json')
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--cohort', str(size),
+                        '--repeats', str(repeats), '--output', out],
+                       cwd=BASE_DIR, env=env, check=True)
+        with open(out) as f:
+            return json.load(f)
+
+
+def compare(current: dict, baseline: dict, tolerance: float, min_delta_ms: float = 0.0,
+            min_runs: int = MIN_RUNS, low_runs_tolerance: float = LOW_RUNS_TOLERANCE):
+    """Compare ``current`` against ``baseline``.
+
+    Returns ``(regressions, low_runs)``: human-readable regressions, and the
+    cases gated at ``low_runs_tolerance`` because either side has fewer than
+    ``min_runs`` runs.
+    """
+    regressions = []
+    low_runs = []
+    for size, cohort in current['cohorts'].items():
+        base = baseline.get('cohorts', {}).get(size)
+        if base is None:
+            continue
+        for name, stats in cohort['cases'].items():
+            ref = base['cases'].get(name)
+            if ref is None:
+                continue
+            allowed = tolerance
+            if stats['runs'] < min_runs or ref['runs'] < min_runs:
+                allowed = max(tolerance, low_runs_tolerance)
+                low_runs.append(f'{size} students: {name}')
+            # Baselines saved before min_ms was recorded fall back to p50
+            cur_ms = stats.get('min_ms', stats['p50_ms'])
+            ref_ms = ref.get('min_ms', ref['p50_ms'])
+            if not ref_ms:
+                continue
+            if cur_ms > ref_ms * (1 + allowed) and cur_ms - ref_ms >= min_delta_ms:
+                regressions.append(f'{size} students: {name} min {cur_ms:.1f}ms '
+                                   f'vs baseline {ref_ms:.1f}ms (allowed {allowed:.0%})')
+        if cohort['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{size} students: peak RSS {cohort['peak_rss_mb']:.0f}MB "
+                               f"vs baseline {base['peak_rss_mb']:.0f}MB")
+    return regressions, low_runs
+
+
+def _print_cohort(cohort: dict):
+    print(f"\n{cohort['students']} students (peak RSS {cohort['peak_rss_mb']:.0f}MB)")
+    print(f"  {'case':32} {'runs':>5} {'min ms':>10} {'p50 ms':>10} {'p99 ms':>10} {'ops/s':>10}")
+    for name, s in cohort['cases'].items():
+        print(f"  {name:32} {s['runs']:>5} {s['min_ms']:>10.2f} {s['p50_ms']:>10.2f} "
+              f"{s['p99_ms']:>10.2f} {s['ops_per_s']:>10.2f}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the backend hot paths.')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help='comma separated cohort sizes')
+    parser.add_argument('--repeats', type=int, default=None, help='runs per case (default scales with size)')
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='compare against this JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed fractional slowdown')
+    parser.add_argument('--min-delta-ms', type=float, default=5.0,
+                        help='ignore slowdowns smaller than this (timer noise on tiny cases)')
+    parser.add_argument('--min-runs', type=int, default=MIN_RUNS,
+                        help='cases with fewer runs (current or baseline) use --low-runs-tolerance')
+    parser.add_argument('--low-runs-tolerance', type=float, default=LOW_RUNS_TOLERANCE,
+                        help='allowed fractional slowdown for cases with fewer than --min-runs runs')
+    parser.add_argument('--cohort', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.cohort:
+        # Child process: run one cohort and write its result
+        result = run_cohort(args.cohort, args.repeats or _default_repeats(args.cohort))
+        with open(args.output, 'w') as f:
+            json.dump(result, f)
+        return 0
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'cohorts': {},
+    }
+    for size in sizes:
+        cohort = _run_in_subprocess(size, args.repeats or _default_repeats(size))
+        results['cohorts'][str(size)] = cohort
+        _print_cohort(cohort)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'\nSaved {args.save}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions, low_runs = compare(results, baseline, args.tolerance, args.min_delta_ms,
+                                        args.min_runs, args.low_runs_tolerance)
+        if low_runs:
+            print(f'\nChecked at {max(args.tolerance, args.low_runs_tolerance):.0%} '
+                  f'(fewer than {args.min_runs} runs): ' + ', '.join(low_runs))
+        if regressions:
+            print('\nRegressions:')
+            for line in regressions:
+                print('  ' + line)
+            return 1
+        print(f'\nNo regressions beyond {args.tolerance:.0%} against {args.baseline}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,14 @@
 import csv
-import sqlite3
 import os
+import batch_scoring
+import db
+import metrics
 
 # CSV and DB paths
 
 base_dir = os.path.dirname(os.path.abspath(__file__))
-csv_file = os.path.join(base_dir, 'student_data.csv')
-db_file = os.path.join(base_dir, 'student_data.db')
+csv_file = os.getenv('STUDENT_CSV', os.path.join(base_dir, 'student_data.csv'))
+db_file = db.DB_FILE
 
 def create_table(cursor):
     cursor.execute('''
@@ -21,17 +23,20 @@ def create_table(cursor):
         )
     ''')
 
-def csv_to_sqlite():
-    conn = sqlite3.connect(db_file)
-    cursor = conn.cursor()
-    create_table(cursor)
-    with open(csv_file, newline='', encoding='utf-8') as csvfile:
+STUDENT_COLUMNS = [
+    'student_id', 'name', 'attendance_percentage', 'avg_test_score',
+    'assignments_submitted', 'total_assignments', 'fees_paid'
+]
+
+def _has_current_schema(cursor):
+    cursor.execute('PRAGMA table_info(students)')
+    return [row[1] for row in cursor.fetchall()] == STUDENT_COLUMNS
+
+def _read_rows(path):
+    with open(path, newline='', encoding='utf-8') as csvfile:
         reader = csv.DictReader(csvfile)
         for row in reader:
-            cursor.execute('''
-                INSERT INTO students (student_id, name, attendance_percentage, avg_test_score, assignments_submitted, total_assignments, fees_paid)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
+            yield (
                 int(row['student_id']),
                 row['name'],
                 int(row['attendance_percentage']),
@@ -39,28 +44,40 @@ def csv_to_sqlite():
                 int(row['assignments_submitted']),
                 int(row['total_assignments']),
                 int(row['fees_paid'])
-            ))
-    conn.commit()
-    conn.close()
+            )
+
+def csv_to_sqlite(replace=False, csv_path=None, db_path=None):
+    """Import the CSV into the students table in one transaction.
+
+    With ``replace`` the existing rows and their materialized predictions are
+    deleted in the same transaction, so concurrent readers keep seeing the old
+    data until the commit.
+    """
+    csv_path = csv_path or csv_file
+    db_path = db_path or db_file
+    with metrics.span('csv_import'), db.transaction(db_path) as conn:
+        cursor = conn.cursor()
+        if replace and not _has_current_schema(cursor):
+            # Stale schema: recreate the table inside the same transaction
+            cursor.execute('DROP TABLE IF EXISTS students')
+        create_table(cursor)
+        if replace:
+            cursor.execute('DELETE FROM students')
+            batch_scoring.clear_predictions(conn)
+        cursor.executemany(db.INSERT_STUDENT, _read_rows(csv_path))
+        metrics.ROWS_PROCESSED.inc(cursor.rowcount, stage='csv_import')
+        # Pre-forked workers republish their shared frame when this changes
+        db.bump_roster_generation(conn)
     print('CSV data imported into SQLite database successfully.')
 
-def rebuild_db_from_csv():
-    """Recreate the SQLite DB from the current CSV, replacing any existing data."""
-    # Remove existing DB to avoid UNIQUE constraint issues and stale data
-    try:
-        if os.path.exists(db_file):
-            os.remove(db_file)
-    except Exception:
-        # Fallback: try to drop the table if file removal fails
-        conn = sqlite3.connect(db_file)
-        cur = conn.cursor()
-        try:
-            cur.execute('DROP TABLE IF EXISTS students')
-            conn.commit()
-        finally:
-            conn.close()
-    # Import fresh CSV data
-    csv_to_sqlite()
+def rebuild_db_from_csv(csv_path=None, db_path=None):
+    """Recreate the students table from the current CSV, replacing any existing data.
+
+    The file is never deleted: other threads and workers hold pooled connections
+    to it. Errors (including a busy/locked database) roll back and propagate,
+    leaving the previous data in place.
+    """
+    csv_to_sqlite(replace=True, csv_path=csv_path, db_path=db_path)
 
 if __name__ == '__main__':
     rebuild_db_from_csv()
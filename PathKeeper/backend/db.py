@@ -0,0 +1,109 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Shared SQLite connection management for app.py and csv_to_sqlite.py.
+#
+# Connections are kept per thread (and per process, so forked workers never
+# reuse a parent's handle) and opened in WAL mode: readers see the last
+# committed snapshot while an import is writing, instead of blocking on the
+# rollback journal. Reusing a connection also reuses sqlite3's per-connection
+# statement cache, so the fixed SQL below is only prepared once per thread.
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+DB_FILE = os.getenv('STUDENT_DB', os.path.join(base_dir, 'student_data.db'))
+
+CACHED_STATEMENTS = 128
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),  # durable at checkpoints; safe with WAL
+    ('busy_timeout', 5000),
+    ('cache_size', -64000),  # negative = KiB, ~64MB page cache per connection
+    ('mmap_size', 268435456),  # 256MB memory-mapped reads
+    ('temp_store', 'MEMORY'),
+)
+
+SELECT_STUDENTS = 'SELECT * FROM students'
+INSERT_STUDENT = '''
+    INSERT INTO students (student_id, name, attendance_percentage, avg_test_score, assignments_submitted, total_assignments, fees_paid)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+# One-row stamp rewritten by every students import (csv_to_sqlite), so
+# pre-forked workers can tell the roster changed whichever path rebuilt it.
+# The value is a time_ns() stamp, so it keeps increasing even if the file is
+# recreated.
+CREATE_ROSTER_GENERATION = '''
+    CREATE TABLE IF NOT EXISTS roster_generation (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        generation INTEGER
+    )
+'''
+SELECT_ROSTER_GENERATION = 'SELECT generation FROM roster_generation WHERE id = 1'
+
+_local = threading.local()
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=5.0, cached_statements=CACHED_STATEMENTS)
+    for name, value in PRAGMAS:
+        conn.execute(f'PRAGMA {name}={value}')
+    return conn
+
+
+def get_connection(path: str = DB_FILE) -> sqlite3.Connection:
+    """Return this thread's connection to ``path``, opening it on first use."""
+    pid = os.getpid()
+    if getattr(_local, 'pid', None) != pid:
+        # Fresh thread, or a forked child holding the parent's handles
+        _local.pid = pid
+        _local.conns = {}
+    conn = _local.conns.get(path)
+    if conn is None:
+        conn = _connect(path)
+        _local.conns[path] = conn
+    return conn
+
+
+@contextmanager
+def transaction(path: str = DB_FILE):
+    """Yield this thread's connection inside a single IMMEDIATE transaction."""
+    conn = get_connection(path)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
+
+
+def bump_roster_generation(conn: sqlite3.Connection):
+    """Record a new roster generation; call inside the import transaction."""
+    conn.execute(CREATE_ROSTER_GENERATION)
+    conn.execute('INSERT INTO roster_generation (id, generation) VALUES (1, ?) '
+                 'ON CONFLICT(id) DO UPDATE SET generation = excluded.generation', (time.time_ns(),))
+
+
+def roster_generation(path: str = DB_FILE) -> int:
+    """Generation of the students table in ``path``; 0 if it was never stamped."""
+    if not os.path.exists(path):
+        return 0
+    try:
+        row = get_connection(path).execute(SELECT_ROSTER_GENERATION).fetchone()
+    except sqlite3.OperationalError:
+        # Imported before generations were recorded
+        return 0
+    return row[0] if row is not None else 0
+
+
+def close_connection(path: str = DB_FILE):
+    """Close this thread's connection to ``path`` if one is open."""
+    if getattr(_local, 'pid', None) != os.getpid():
+        return
+    conn = _local.conns.pop(path, None)
+    if conn is not None:
+        conn.close()
@@ -12,8 +12,8 @@ last_names = [
 ]
 
 
-def generate_new_dataset(num_students: int = 300, seed: int | None = None) -> str:
-    """Generate a fresh synthetic dataset CSV and return its path."""
+def generate_new_dataset(num_students: int = 300, seed: int | None = None, out_path: str | None = None) -> str:
+    """Generate a fresh synthetic dataset CSV (default: backend/student_data.csv) and return its path."""
     if seed is not None:
         random.seed(seed)
     else:
@@ -31,8 +31,9 @@ def generate_new_dataset(num_students: int = 300, seed: int | None = None) -> st
         fees_paid = random.choices([0, 1], [0.2, 0.8])[0]
         rows.append([sid, name, attendance, score, assignments_submitted, total_assignments, fees_paid])
 
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    out_path = os.path.join(base_dir, 'student_data.csv')
+    if out_path is None:
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        out_path = os.path.join(base_dir, 'student_data.csv')
     with open(out_path, 'w', newline='') as f:
         w = csv.writer(f)
         w.writerow([
@@ -0,0 +1,293 @@
+import bisect
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Minimal in-process metrics with Prometheus text exposition (served at /metrics).
+#
+# Each observation is a perf_counter read, a bisect and a short lock hold, so
+# spans are cheap enough to leave on in production.
+#
+# Under the pre-forked launcher (see wsgi.py) every worker writes its values to
+# <METRICS_DIR>/<pid>.json every FLUSH_SECONDS, and a scrape of /metrics on any
+# worker merges all files: counters and histograms are summed across workers
+# (including ones that have exited), gauges are reported per live worker with a
+# ``worker="<pid>"`` label. Other workers' values may lag by up to FLUSH_SECONDS.
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+FLUSH_SECONDS = 5.0
+
+REGISTRY: List['_Metric'] = []
+# Set by enable_multiprocess(); None means single-process exposition
+METRICS_DIR: Optional[str] = None
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Tuple, extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, object]) -> Tuple:
+        return tuple(str(labels.get(n, '')) for n in self.labels)
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+    def snapshot(self):
+        """JSON-serializable copy of this process's values."""
+        raise NotImplementedError
+
+    def merge(self, acc: Dict, snap, worker: str):
+        """Fold one worker's ``snapshot()`` into ``acc``."""
+        raise NotImplementedError
+
+    def reset(self):
+        raise NotImplementedError
+
+    def render(self, values: Optional[Dict] = None) -> List[str]:
+        """Exposition lines for ``values`` (merged), or this process's own values."""
+        if values is None:
+            values = {}
+            self.merge(values, self.snapshot(), '')
+        return self.header() + self._lines(values)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def merge(self, acc, snap, worker):
+        for key, value in snap:
+            key = tuple(key)
+            acc[key] = acc.get(key, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def _lines(self, values):
+        return [f'{self.name}{_format_labels(self.labels, key)} {value}' for key, value in values.items()]
+
+
+class Gauge(_Metric):
+    """Gauge read from ``fn`` at scrape time, or set explicitly."""
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, help_text)
+        self._fn = fn
+        self._value = 0.0
+
+    def set(self, value: float):
+        self._value = value
+
+    def snapshot(self):
+        return self._fn() if self._fn is not None else self._value
+
+    def merge(self, acc, snap, worker):
+        acc[worker] = snap
+
+    def reset(self):
+        self._value = 0.0
+
+    def _lines(self, values):
+        lines = []
+        for worker, value in values.items():
+            labels = _format_labels(('worker',), (worker,)) if worker else ''
+            lines.append(f'{self.name}{labels} {value}')
+        return lines
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        # key -> [bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 2)
+            row[idx] += 1
+            row[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), list(row)] for key, row in self._values.items()]
+
+    def merge(self, acc, snap, worker):
+        for key, row in snap:
+            key = tuple(key)
+            total = acc.get(key)
+            acc[key] = row if total is None else [a + b for a, b in zip(total, row)]
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def _lines(self, values):
+        lines = []
+        for key, row in values.items():
+            cumulative = 0
+            base = _format_labels(self.labels, key)
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                le = _format_labels(self.labels, key, 'le="%s"' % bound)
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            cumulative += row[len(self.buckets)]
+            le = _format_labels(self.labels, key, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{le} {cumulative}')
+            lines.append(f'{self.name}_sum{base} {row[-1]}')
+            lines.append(f'{self.name}_count{base} {cumulative}')
+        return lines
+
+
+def percentile(samples: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of raw samples (used by bench.py and sqlite_load_test.py)."""
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+class span:
+    """Time a block into STAGE_SECONDS: ``with metrics.span('enrich_with_risk'): ...``"""
+    __slots__ = ('stage', 't0')
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        STAGE_SECONDS.observe(time.perf_counter() - self.t0, stage=self.stage)
+        return False
+
+
+def enable_multiprocess(path: str):
+    """Aggregate metrics across pre-forked workers via files in ``path``.
+
+    Call once in the launcher before forking; stale files from a previous run
+    are removed.
+    """
+    global METRICS_DIR
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(path):
+        if name.endswith('.json'):
+            os.remove(os.path.join(path, name))
+    METRICS_DIR = path
+
+
+def flush(gauges: bool = True):
+    """Write this process's values to its file in METRICS_DIR."""
+    state = {m.name: m.snapshot() for m in REGISTRY if gauges or not isinstance(m, Gauge)}
+    path = os.path.join(METRICS_DIR, f'{os.getpid()}.json')
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def start_worker(interval: float = FLUSH_SECONDS) -> threading.Thread:
+    """Call in each forked worker: drop values inherited from the launcher and flush periodically."""
+    for metric in REGISTRY:
+        metric.reset()
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                flush()
+            except OSError:
+                pass
+
+    thread = threading.Thread(target=loop, name='metrics-flush', daemon=True)
+    thread.start()
+    return thread
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merged() -> Dict[str, Dict]:
+    flush()
+    merged: Dict[str, Dict] = {m.name: {} for m in REGISTRY}
+    for name in os.listdir(METRICS_DIR):
+        if not name.endswith('.json'):
+            continue
+        worker = name[:-5]
+        try:
+            with open(os.path.join(METRICS_DIR, name)) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            continue
+        alive = worker == str(os.getpid()) or _alive(int(worker))
+        for metric in REGISTRY:
+            if metric.name not in state or (isinstance(metric, Gauge) and not alive):
+                continue
+            metric.merge(merged[metric.name], state[metric.name], worker)
+    return merged
+
+
+def render() -> str:
+    lines: List[str] = []
+    merged = _merged() if METRICS_DIR is not None else None
+    for metric in REGISTRY:
+        lines.extend(metric.render(merged[metric.name] if merged is not None else None))
+    return '\n'.join(lines) + '\n'
+
+
+REQUEST_SECONDS = Histogram('pathkeeper_request_seconds', 'HTTP request latency by route.',
+                            ('route', 'method', 'status'))
+STAGE_SECONDS = Histogram('pathkeeper_stage_seconds', 'Time spent per hot-path stage.', ('stage',))
+ROWS_PROCESSED = Counter('pathkeeper_rows_processed_total', 'Rows processed per stage.', ('stage',))
+CACHE_REQUESTS = Counter('pathkeeper_cache_requests_total', 'Cache lookups by cache and result.',
+                         ('cache', 'result'))
+TRAINING_SECONDS = Histogram('pathkeeper_training_seconds', 'Model training duration.',
+                             buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+SCHEDULER_RUNS = Counter('pathkeeper_scheduler_runs_total', 'Scheduled retrain runs by result.', ('result',))
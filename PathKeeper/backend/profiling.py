@@ -0,0 +1,245 @@
+import cProfile
+import hmac
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from flask import Response, g, jsonify, request, send_file
+
+import shared_frame
+
+# Admin-only, on-demand profiling for live requests.
+#
+# Disabled unless PROFILING_TOKEN is set: init_app() then registers nothing, so
+# there is no per-request cost. When enabled:
+#   - a request carrying ``X-Profile: <token>`` (or ``?__profile=1`` plus
+#     ``X-Profile-Token: <token>``) runs under cProfile; the response gets an
+#     ``X-Profile-Id`` header and the pstats file is downloadable from
+#     GET /admin/profiles/<id>
+#   - GET /admin/profile/sample?seconds=N samples the stacks of every thread
+#     (request workers, the retrain scheduler, batch scoring) for N seconds
+#     and returns a collapsed-stack file for flamegraph tools. Under the
+#     pre-forked launcher every worker samples itself (see start_worker) and
+#     each stack is rooted at ``worker-<pid>``.
+# Admin routes require ``X-Profile-Token: <token>``. The token is only read
+# from headers so it never ends up in access or proxy logs.
+
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'pathkeeper-profiles'))
+MAX_PROFILES = 20
+MAX_SAMPLE_SECONDS = 60
+# How long the handler waits past the deadline for workers to write their stacks
+SAMPLE_GRACE_SECONDS = 1.0
+WATCH_INTERVAL = 0.1
+
+# cProfile can only trace one request at a time per interpreter (3.12+), so
+# concurrent profile requests are served unprofiled.
+_PROFILE_LOCK = threading.Lock()
+_ID_RE = re.compile(r'^[A-Za-z0-9_.-]+$')
+# Threads waiting on an all-worker sample; left out of this worker's stacks
+_SAMPLE_WAITERS = set()
+
+
+def _token_ok(value: Optional[str]) -> bool:
+    # compare_digest rejects non-ASCII str; compare the UTF-8 bytes instead
+    return bool(value) and hmac.compare_digest(value.encode('utf-8'), PROFILING_TOKEN.encode('utf-8'))
+
+
+def _is_admin() -> bool:
+    return _token_ok(request.headers.get('X-Profile-Token'))
+
+
+def _start_profile():
+    if not (_token_ok(request.headers.get('X-Profile'))
+            or (request.args.get('__profile') == '1' and _is_admin())):
+        return
+    if not _PROFILE_LOCK.acquire(blocking=False):
+        g.profile_error = 'busy'
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler (e.g. a debugger) is already active
+        _PROFILE_LOCK.release()
+        g.profile_error = 'unavailable'
+        return
+    g.profiler = profiler
+
+
+def _finish_profile(response):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        error = g.pop('profile_error', None)
+        if error:
+            response.headers['X-Profile-Error'] = error
+        return response
+    try:
+        profiler.disable()
+    finally:
+        _PROFILE_LOCK.release()
+    route = (request.url_rule.rule if request.url_rule is not None else 'unmatched').strip('/')
+    profile_id = f"{int(time.time() * 1000)}-{os.getpid()}-{re.sub(r'[^A-Za-z0-9]+', '_', route) or 'root'}"
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(PROFILE_DIR, f'{profile_id}.prof'))
+    _prune_profiles()
+    response.headers['X-Profile-Id'] = profile_id
+    return response
+
+
+def _abandon_profile(exc=None):
+    # after_request is skipped on unhandled errors; never leave the profiler running
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _PROFILE_LOCK.release()
+
+
+def _prune_profiles():
+    try:
+        files = sorted(
+            (os.path.join(PROFILE_DIR, f) for f in os.listdir(PROFILE_DIR) if f.endswith('.prof')),
+            key=os.path.getmtime,
+        )
+        for path in files[:-MAX_PROFILES]:
+            os.remove(path)
+    except OSError:
+        pass
+
+
+def sample_stacks(seconds: float, interval: float = 0.01) -> Counter:
+    """Sample every thread's Python stack for ``seconds``; return collapsed-stack counts."""
+    own = threading.get_ident()
+    counts: Counter = Counter()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own or ident in _SAMPLE_WAITERS:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            stack.append(names.get(ident, f'thread-{ident}'))
+            counts[';'.join(reversed(stack))] += 1
+        time.sleep(interval)
+    return counts
+
+
+def _sample_dir(sample_id: int) -> str:
+    return os.path.join(PROFILE_DIR, 'samples', str(sample_id))
+
+
+def _watch_samples():
+    seen = shared_frame.get_sample_request()[0]
+    while True:
+        time.sleep(WATCH_INTERVAL)
+        sample_id, until_ns, interval_us = shared_frame.get_sample_request()
+        if sample_id == seen:
+            continue
+        seen = sample_id
+        remaining = (until_ns - time.time_ns()) / 1e9
+        if remaining <= 0:
+            continue
+        counts = sample_stacks(remaining, interval_us / 1e6)
+        out_dir = _sample_dir(sample_id)
+        os.makedirs(out_dir, exist_ok=True)
+        path = os.path.join(out_dir, f'{os.getpid()}.collapsed')
+        with open(f'{path}.tmp', 'w') as f:
+            f.writelines(f'{stack} {n}\n' for stack, n in counts.items())
+        os.replace(f'{path}.tmp', path)
+
+
+def start_worker():
+    """Call in each pre-forked worker: join all-worker stack samples. No-op when disabled."""
+    if not PROFILING_TOKEN:
+        return None
+    thread = threading.Thread(target=_watch_samples, name='profile-sampler', daemon=True)
+    thread.start()
+    return thread
+
+
+def _sample_all_workers(seconds: float, interval: float) -> Optional[Counter]:
+    sample_id = shared_frame.request_sample(seconds, interval)
+    if sample_id is None:
+        return None
+    _SAMPLE_WAITERS.add(threading.get_ident())
+    try:
+        time.sleep(seconds + interval + SAMPLE_GRACE_SECONDS)
+    finally:
+        _SAMPLE_WAITERS.discard(threading.get_ident())
+    counts: Counter = Counter()
+    out_dir = _sample_dir(sample_id)
+    try:
+        names = [f for f in os.listdir(out_dir) if f.endswith('.collapsed')]
+    except FileNotFoundError:
+        names = []
+    for name in names:
+        root = f'worker-{name[:-len(".collapsed")]}'
+        with open(os.path.join(out_dir, name)) as f:
+            for line in f:
+                stack, _, n = line.rstrip('\n').rpartition(' ')
+                counts[f'{root};{stack}'] += int(n)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    return counts
+
+
+def init_app(app):
+    """Register profiling hooks and admin routes if PROFILING_TOKEN is set."""
+    if not PROFILING_TOKEN:
+        return False
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.teardown_request(_abandon_profile)
+
+    @app.route('/admin/profiles', methods=['GET'])
+    def list_profiles():
+        if not _is_admin():
+            return jsonify({'error': 'forbidden'}), 403
+        try:
+            names = sorted((f[:-5] for f in os.listdir(PROFILE_DIR) if f.endswith('.prof')), reverse=True)
+        except FileNotFoundError:
+            names = []
+        return jsonify({'profiles': names})
+
+    @app.route('/admin/profiles/<profile_id>', methods=['GET'])
+    def download_profile(profile_id: str):
+        if not _is_admin():
+            return jsonify({'error': 'forbidden'}), 403
+        path = os.path.join(PROFILE_DIR, f'{profile_id}.prof')
+        if not _ID_RE.match(profile_id) or not os.path.exists(path):
+            return jsonify({'error': 'not found'}), 404
+        return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                         download_name=f'{profile_id}.prof')
+
+    @app.route('/admin/profile/sample', methods=['GET', 'POST'])
+    def sample_profile():
+        if not _is_admin():
+            return jsonify({'error': 'forbidden'}), 403
+        try:
+            seconds = float(request.args.get('seconds', '5'))
+            interval = float(request.args.get('interval', '0.01'))
+        except ValueError:
+            return jsonify({'error': 'seconds and interval must be numbers'}), 400
+        seconds = max(0.1, min(MAX_SAMPLE_SECONDS, seconds))
+        interval = max(0.001, min(1.0, interval))
+        if shared_frame.is_enabled():
+            counts = _sample_all_workers(seconds, interval)
+            if counts is None:
+                return jsonify({'error': 'a sample is already running'}), 409
+        else:
+            counts = sample_stacks(seconds, interval)
+        body = ''.join(f'{stack} {n}\n' for stack, n in counts.most_common())
+        return Response(body, mimetype='text/plain', headers={
+            'Content-Disposition': f'attachment; filename=stacks-{os.getpid()}-{int(time.time())}.collapsed'
+        })
+
+    return True
@@ -0,0 +1,298 @@
+import json
+import os
+import pickle
+import struct
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import metrics
+
+# Shared-memory student frame for the pre-forked launcher (see wsgi.py).
+#
+# The parent process publishes the student table into a SharedMemory segment
+# before forking, and the first worker to see a DB rebuild republishes it;
+# every worker maps the same pages and builds its DataFrame from zero-copy
+# numpy views. A small control segment of int64 fields
+# coordinates the workers: the current frame version, the roster generation
+# (db.roster_generation) it was read from, the model version in latest.pkl, the
+# model version allocator, the retrain scheduler interval and the current
+# all-worker stack sampling request (see profiling.py).
+
+_CTL_FIELDS = ('frame_version', 'roster_generation', 'model_version', 'model_alloc', 'scheduler_interval',
+               'sample_id', 'sample_until_ns', 'sample_interval_us')
+_CTL_SIZE = 8 * len(_CTL_FIELDS)
+_ALIGN = 64
+
+PREFIX: Optional[str] = None
+LOCK = None
+_CTL: Optional[shared_memory.SharedMemory] = None
+# Per-process cache of the attached segment and the frame built on it
+_ATTACHED: Dict[str, object] = {'version': 0, 'shm': None, 'frame': None}
+_RETIRED: List[shared_memory.SharedMemory] = []
+_ATTACH_LOCK = threading.Lock()
+
+
+def init(prefix: Optional[str] = None) -> str:
+    """Create the control segment. Call once in the parent before forking."""
+    global PREFIX, LOCK, _CTL
+    PREFIX = prefix or f'pk_students_{os.getpid()}'
+    LOCK = multiprocessing.Lock()
+    _CTL = shared_memory.SharedMemory(name=f'{PREFIX}_ctl', create=True, size=_CTL_SIZE)
+    _CTL.buf[:_CTL_SIZE] = bytes(_CTL_SIZE)
+    return PREFIX
+
+
+def is_enabled() -> bool:
+    return _CTL is not None
+
+
+def _get(field: str) -> int:
+    return struct.unpack_from('q', _CTL.buf, 8 * _CTL_FIELDS.index(field))[0]
+
+
+def _set(field: str, value: int):
+    struct.pack_into('q', _CTL.buf, 8 * _CTL_FIELDS.index(field), int(value))
+
+
+def _segment_name(version: int) -> str:
+    return f'{PREFIX}_f{version}'
+
+
+def _round_up(n: int) -> int:
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _encode_column(series: pd.Series):
+    """Return (kind, arrays) for one column.
+
+    Numeric columns are shared as-is. All-text columns are shared as
+    fixed-width unicode plus a NULL mask. Anything else (mixed types) is
+    pickled into the segment and unpickled once per worker and version.
+    """
+    values = series.to_numpy()
+    if values.dtype.kind in 'biuf':
+        return 'array', [np.ascontiguousarray(values)]
+    mask = pd.isna(series).to_numpy()
+    present = values[~mask]
+    if all(isinstance(v, str) for v in present):
+        text = np.where(mask, '', values).astype(str)
+        return 'text', [np.ascontiguousarray(text), np.ascontiguousarray(mask)]
+    blob = pickle.dumps(list(values), protocol=pickle.HIGHEST_PROTOCOL)
+    return 'pickle', [np.frombuffer(blob, dtype=np.uint8)]
+
+
+def refresh(generation: int, load: Callable[[], pd.DataFrame]) -> bool:
+    """Publish ``load()`` as roster ``generation`` unless the frame is already that new.
+
+    Read ``generation`` before the rows ``load`` returns, so a rebuild landing in
+    between is picked up again on the next call. Returns True if it published.
+    """
+    with LOCK:
+        if _get('frame_version') and generation <= _get('roster_generation'):
+            return False
+        _publish_locked(load())
+        _set('roster_generation', generation)
+        return True
+
+
+def get_roster_generation() -> int:
+    """Roster generation the current frame was read from."""
+    return _get('roster_generation')
+
+
+def _publish_locked(df: pd.DataFrame) -> int:
+    # Copy ``df`` into a new shared segment and make it the current version
+    columns = []
+    arrays = []
+    offset = 0
+    for col in df.columns:
+        kind, parts = _encode_column(df[col])
+        meta = {'name': col, 'kind': kind, 'parts': []}
+        for arr in parts:
+            meta['parts'].append({'dtype': arr.dtype.str, 'shape': arr.shape[0], 'offset': offset})
+            arrays.append((offset, arr))
+            offset = _round_up(offset + arr.nbytes)
+        columns.append(meta)
+    header = json.dumps({'rows': len(df), 'columns': columns}).encode('utf-8')
+    data_start = _round_up(8 + len(header))
+
+    frame_version = _get('frame_version')
+    version = frame_version + 1
+    shm = shared_memory.SharedMemory(name=_segment_name(version), create=True,
+                                     size=max(1, data_start + offset))
+    struct.pack_into('q', shm.buf, 0, len(header))
+    shm.buf[8:8 + len(header)] = header
+    for arr_offset, arr in arrays:
+        view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf,
+                          offset=data_start + arr_offset)
+        view[:] = arr
+        del view
+    _set('frame_version', version)
+    shm.close()
+    # Workers that already mapped the old version keep a valid mapping
+    if frame_version:
+        try:
+            old = shared_memory.SharedMemory(name=_segment_name(frame_version))
+            old.close()
+            old.unlink()
+        except FileNotFoundError:
+            pass
+    return version
+
+
+def _attach(version: int) -> pd.DataFrame:
+    shm = shared_memory.SharedMemory(name=_segment_name(version))
+    (header_len,) = struct.unpack_from('q', shm.buf, 0)
+    header = json.loads(bytes(shm.buf[8:8 + header_len]).decode('utf-8'))
+    data_start = _round_up(8 + header_len)
+    rows = header['rows']
+    cols = {}
+    for meta in header['columns']:
+        parts = []
+        for part in meta['parts']:
+            arr = np.ndarray((part['shape'],), dtype=np.dtype(part['dtype']), buffer=shm.buf,
+                             offset=data_start + part['offset'])
+            arr.flags.writeable = False
+            parts.append(arr)
+        if meta['kind'] == 'array':
+            cols[meta['name']] = parts[0]
+        elif meta['kind'] == 'text':
+            text, mask = parts
+            values = text.astype(object)
+            values[mask] = None
+            cols[meta['name']] = values
+        else:
+            cols[meta['name']] = pickle.loads(parts[0].tobytes())
+    frame = pd.DataFrame(cols, copy=False)
+    old = _ATTACHED.get('shm')
+    _ATTACHED.update(version=version, shm=shm, frame=frame)
+    if old is not None:
+        _RETIRED.append(old)
+    # In-flight requests may still hold views into retired segments
+    for seg in list(_RETIRED):
+        try:
+            seg.close()
+            _RETIRED.remove(seg)
+        except BufferError:
+            pass
+    return frame
+
+
+def current_frame() -> pd.DataFrame:
+    """Return the current student frame, re-attaching if a newer version exists."""
+    for _ in range(5):
+        version = _get('frame_version')
+        frame = _ATTACHED['frame']
+        if version == _ATTACHED['version'] and frame is not None:
+            metrics.CACHE_REQUESTS.inc(cache='shared_frame', result='hit')
+            return frame
+        with _ATTACH_LOCK:
+            if version == _ATTACHED['version'] and _ATTACHED['frame'] is not None:
+                return _ATTACHED['frame']
+            metrics.CACHE_REQUESTS.inc(cache='shared_frame', result='miss')
+            try:
+                return _attach(version)
+            except FileNotFoundError:
+                # Swapped out between reading the version and attaching; retry
+                continue
+    raise RuntimeError('Shared student frame unavailable')
+
+
+def get_model_version() -> int:
+    """Version of the model currently in latest.pkl."""
+    return _get('model_version')
+
+
+def set_model_version(model_version: int):
+    """Raise the published model version to ``model_version``; never lowers it."""
+    with LOCK:
+        if model_version > _get('model_version'):
+            _set('model_version', model_version)
+        if model_version > _get('model_alloc'):
+            _set('model_alloc', model_version)
+
+
+def allocate_model_version(floor: int = 0) -> int:
+    """Return a model version no other worker has been or will be given."""
+    with LOCK:
+        version = max(_get('model_alloc'), _get('model_version'), floor) + 1
+        _set('model_alloc', version)
+        return version
+
+
+def publish_model(version: int, write_latest) -> bool:
+    """Call ``write_latest()`` and publish ``version`` unless a newer model is already out.
+
+    Runs under the cross-process lock so latest.pkl and the published version
+    always agree. Returns False if ``version`` was superseded.
+    """
+    with LOCK:
+        if version <= _get('model_version'):
+            return False
+        write_latest()
+        _set('model_version', version)
+        return True
+
+
+def start_scheduler(interval_seconds: int) -> bool:
+    """Ask the scheduler owner to run retrains; False if already scheduled."""
+    with LOCK:
+        if _get('scheduler_interval'):
+            return False
+        _set('scheduler_interval', interval_seconds)
+        return True
+
+
+def stop_scheduler() -> bool:
+    """Ask the scheduler owner to stop; False if it was not scheduled."""
+    with LOCK:
+        if not _get('scheduler_interval'):
+            return False
+        _set('scheduler_interval', 0)
+        return True
+
+
+def get_scheduler_interval() -> int:
+    return _get('scheduler_interval')
+
+
+def request_sample(seconds: float, interval: float) -> Optional[int]:
+    """Ask every worker to sample its stacks for ``seconds``; None if a sample is running."""
+    with LOCK:
+        now = time.time_ns()
+        if _get('sample_until_ns') > now:
+            return None
+        sample_id = _get('sample_id') + 1
+        _set('sample_until_ns', now + int(seconds * 1e9))
+        _set('sample_interval_us', int(interval * 1e6))
+        _set('sample_id', sample_id)
+        return sample_id
+
+
+def get_sample_request():
+    """Return (sample_id, deadline in time.time_ns(), interval in microseconds)."""
+    return _get('sample_id'), _get('sample_until_ns'), _get('sample_interval_us')
+
+
+def shutdown():
+    """Unlink all segments. Call in the parent once workers have exited."""
+    global _CTL
+    if _CTL is None:
+        return
+    version = _get('frame_version')
+    if version:
+        try:
+            seg = shared_memory.SharedMemory(name=_segment_name(version))
+            seg.close()
+            seg.unlink()
+        except FileNotFoundError:
+            pass
+    _CTL.close()
+    _CTL.unlink()
+    _CTL = None
@@ -0,0 +1,107 @@
+"""Load test: student reads stay fast while a CSV import is running.
+
+Builds a scratch DB in a temp dir, measures read latency through the pooled
+connections alone, then again while another thread re-imports the CSV in a
+loop. Exits non-zero if the p99 read latency under import exceeds the
+idle p99 by more than ``--max-ratio``.
+
+    python sqlite_load_test.py --students 20000 --seconds 5
+"""
+import argparse
+import contextlib
+import csv
+import io
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+import db
+from csv_to_sqlite import csv_to_sqlite, rebuild_db_from_csv
+from metrics import percentile
+
+
+def _write_csv(path: str, num_students: int):
+    random.seed(7)
+    with open(path, 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow([
+            'student_id','name','attendance_percentage','avg_test_score',
+            'assignments_submitted','total_assignments','fees_paid'
+        ])
+        for i in range(num_students):
+            w.writerow([101 + i, f'Student {i}', random.randint(30, 100), random.randint(25, 100),
+                        random.randint(0, 10), 10, random.choice([0, 1, 1])])
+
+
+def _read_latencies(db_path: str, seconds: float, readers: int):
+    samples = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def reader():
+        local = []
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            pd.read_sql_query(db.SELECT_STUDENTS, db.get_connection(db_path))
+            local.append((time.perf_counter() - t0) * 1000.0)
+        db.close_connection(db_path)
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=20000)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--max-ratio', type=float, default=1.5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'students.csv')
+        db_path = os.path.join(tmp, 'students.db')
+        _write_csv(csv_path, args.students)
+        csv_to_sqlite(csv_path=csv_path, db_path=db_path)
+
+        idle = _read_latencies(db_path, args.seconds, args.readers)
+
+        stop = threading.Event()
+        imports = [0]
+
+        def writer():
+            while not stop.is_set():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    rebuild_db_from_csv(csv_path=csv_path, db_path=db_path)
+                imports[0] += 1
+            db.close_connection(db_path)
+
+        wt = threading.Thread(target=writer)
+        wt.start()
+        busy = _read_latencies(db_path, args.seconds, args.readers)
+        stop.set()
+        wt.join()
+        db.close_connection(db_path)
+
+    idle_p50, idle_p99 = percentile(idle, 50), percentile(idle, 99)
+    busy_p50, busy_p99 = percentile(busy, 50), percentile(busy, 99)
+    ratio = busy_p99 / idle_p99 if idle_p99 else 0.0
+    print(f'idle:   reads={len(idle)} p50={idle_p50:.2f}ms p99={idle_p99:.2f}ms')
+    print(f'import: reads={len(busy)} p50={busy_p50:.2f}ms p99={busy_p99:.2f}ms imports={imports[0]}')
+    print(f'p99 ratio {ratio:.2f} (max {args.max_ratio})')
+    return 0 if ratio <= args.max_ratio else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
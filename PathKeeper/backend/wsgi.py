@@ -1,5 +1,123 @@
 import os
+import shutil
+import signal
+import socket
+import tempfile
+import time
+import app as app_module
 from app import app
+import db
+import metrics
+import profiling
+import shared_frame
+
+
+def _serve(host, port, sockets=None):
+    if sockets is not None:
+        from waitress import serve
+        serve(app, sockets=sockets)
+        return
+    try:
+        from waitress import serve
+        serve(app, host=host, port=port)
+    except Exception:
+        app.run(host=host, port=port, debug=False)
+
+
+# Respawn backoff: a worker that dies within FAST_EXIT_SECONDS of starting counts
+# as a failed start; the delay doubles per consecutive failure up to
+# MAX_RESPAWN_DELAY, and the launcher gives up after MAX_FAST_EXITS.
+FAST_EXIT_SECONDS = 10
+MAX_RESPAWN_DELAY = 30
+MAX_FAST_EXITS = 8
+
+
+def serve_prefork(host: str, port: int, workers: int):
+    """Load the model and student frame once, then fork ``workers`` waitress processes.
+
+    The model is loaded on import of ``app`` and is shared copy-on-write; the student
+    frame is published to shared memory so every worker reads the same pages.
+    Worker 0 owns the retrain scheduler. /metrics on any worker reports all workers
+    (see metrics.py); the files live in METRICS_DIR.
+    """
+    metrics_dir = os.getenv('METRICS_DIR') or tempfile.mkdtemp(prefix='pathkeeper-metrics-')
+    metrics.enable_multiprocess(metrics_dir)
+    shared_frame.init()
+    shared_frame.refresh(db.roster_generation(), app_module._read_students_df)
+    shared_frame.set_model_version(app_module.MODEL_VERSION)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    # Startup work done here is reported once, not once per worker
+    metrics.flush(gauges=False)
+
+    children = {}  # pid -> (worker index, start time)
+    stopping = False
+    fast_exits = 0
+
+    def spawn(index: int):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                metrics.start_worker()
+                profiling.start_worker()
+                if index == 0:
+                    app_module.start_scheduler_owner()
+                _serve(host, port, sockets=[sock])
+            finally:
+                os._exit(0)
+        children[pid] = (index, time.monotonic())
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for index in range(workers):
+        spawn(index)
+    print(f'Serving on http://{host}:{port} with {workers} workers')
+    try:
+        while children:
+            try:
+                pid, _status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            index, started = children.pop(pid, (None, 0))
+            if stopping or index is None:
+                continue
+            if time.monotonic() - started < FAST_EXIT_SECONDS:
+                fast_exits += 1
+            else:
+                fast_exits = 0
+            if fast_exits >= MAX_FAST_EXITS:
+                print(f'Worker {index} keeps failing at startup; shutting down')
+                stop(None, None)
+                continue
+            delay = min(MAX_RESPAWN_DELAY, 2 ** fast_exits - 1)
+            if delay:
+                print(f'Worker {index} exited early; respawning in {delay}s')
+                time.sleep(delay)
+            if not stopping:
+                # Replace a crashed worker, keeping its index (and scheduler role)
+                spawn(index)
+    finally:
+        sock.close()
+        shared_frame.shutdown()
+        if not os.getenv('METRICS_DIR'):
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
 
 if __name__ == "__main__":
     # Fallback runner: use waitress if available, else Flask built-in
@@ -9,7 +127,10 @@ if __name__ == "__main__":
     except Exception:
         port = 5055
     try:
-        from waitress import serve
-        serve(app, host=host, port=port)
+        workers = int(os.getenv("WORKERS", "1"))
     except Exception:
-        app.run(host=host, port=port, debug=False)
+        workers = 1
+    if workers > 1 and hasattr(os, "fork"):
+        serve_prefork(host, port, workers)
+    else:
+        _serve(host, port)